@@ -1,3 +1,10 @@
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+
 class Point:
     def __init__(self, x, y):
         self.x = x
@@ -10,6 +17,46 @@ def draw_point(p):
 # ^^^ we are given this API ^^^
 
 
+class PointSink(ABC):  # where adapted points end up - lets us measure drawing separately from terminal I/O
+    @abstractmethod
+    def draw_point(self, p):
+        pass
+
+    def flush(self):
+        pass
+
+
+class PrintSink(PointSink):  # the given API - one print per point
+    def draw_point(self, p):
+        draw_point(p)
+
+
+class FramebufferSink(PointSink):  # points go to memory, the terminal is written once per flush
+    def __init__(self, width, height, stream=None):
+        self.width = width
+        self.height = height
+        self.stream = stream
+        self.framebuffer = bytearray(width * height)
+
+    def draw_point(self, p):
+        if 0 <= p.x < self.width and 0 <= p.y < self.height:
+            self.framebuffer[p.y * self.width + p.x] = 1
+
+    def flush(self):
+        pixels = self.framebuffer.translate(b" ." + bytes(254))
+        rows = [pixels[y * self.width:(y + 1) * self.width] for y in range(self.height)]
+        (self.stream or sys.stdout).write(b"\n".join(rows).decode() + "\n")
+        self.framebuffer = bytearray(self.width * self.height)
+
+
+class NullSink(PointSink):  # for benchmarks - only counts points
+    def __init__(self):
+        self.count = 0
+
+    def draw_point(self, p):
+        self.count += 1
+
+
 # our existing API
 class Line:
     def __init__(self, start, end):
@@ -43,20 +90,141 @@ class LineToPointAdapter(list):  # adapter
         bottom = min(line.start.y, line.end.y)
 
         if right - left == 0:
-            for y in range(top, bottom):
+            for y in range(bottom, top):
                 self.append(Point(left, y))
         elif line.end.y - line.start.y == 0:
             for x in range(left, right):
                 self.append(Point(x, top))
 
 
-def draw(recs):
+class LazyLineToPointAdapter:  # adapter producing points on demand - nothing is stored
+    def __init__(self, line):
+        self.line = line
+
+    def __iter__(self):  # Bresenham's algorithm - works for any slope, endpoints included
+        x0, y0 = self.line.start.x, self.line.start.y
+        x1, y1 = self.line.end.x, self.line.end.y
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx + dy
+        while True:
+            yield Point(x0, y0)
+            if x0 == x1 and y0 == y1:
+                return
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+
+def draw(recs, sink=None):
+    sink = sink or PrintSink()
     print("\n\n--- Drawing some staff ---\n")
     for rectangle in recs:
         for line in rectangle:
             adapter = LineToPointAdapter(line)
             for p in adapter:  # completing adapter
-                draw_point(p)  # using initial API to which we adapted our system
+                sink.draw_point(p)  # using initial API to which we adapted our system
+    sink.flush()
+
+
+def draw_lazy(recs, sink=None):
+    sink = sink or PrintSink()
+    print("\n\n--- Drawing some staff lazily ---\n")
+    for rectangle in recs:
+        for line in rectangle:
+            for p in LazyLineToPointAdapter(line):
+                sink.draw_point(p)
+    sink.flush()
+
+
+def rasterize(recs):  # whole scene -> one flat array of x, y pairs (array('i') is a C int32 buffer)
+    lines = [(line.start.x, line.start.y, line.end.x, line.end.y, line) for rectangle in recs for line in rectangle]
+    coords = array("i")
+    if not lines:
+        return coords
+    low = min(min(x0, y0, x1, y1) for x0, y0, x1, y1, _ in lines)
+    high = max(max(x0, y0, x1, y1) for x0, y0, x1, y1, _ in lines)
+    pixels = sum(abs(x1 - x0) + abs(y1 - y0) + 1 for x0, y0, x1, y1, _ in lines)
+    # every coordinate run is a slice of one shared ramp, copied in C - unless the shapes are so far apart
+    # that a ramp over the whole span would cost more than the pixels themselves
+    ramp = array("i", range(low, high + 1)) if high - low < 4 * pixels else None
+    for x0, y0, x1, y1, line in lines:
+        if y0 == y1:  # axis-aligned lines: a constant block with the coordinate run written into every other slot
+            start, n = min(x0, x1), abs(x1 - x0) + 1
+            run = array("i", (y0,)) * (2 * n)
+            run[0::2] = ramp[start - low:start - low + n] if ramp is not None else array("i", range(start, start + n))
+        elif x0 == x1:
+            start, n = min(y0, y1), abs(y1 - y0) + 1
+            run = array("i", (x0,)) * (2 * n)
+            run[1::2] = ramp[start - low:start - low + n] if ramp is not None else array("i", range(start, start + n))
+        else:
+            run = array("i")
+            for p in LazyLineToPointAdapter(line):
+                run.extend((p.x, p.y))
+        coords += run
+    return coords
+
+
+def paint(recs, width, height):  # whole scene -> framebuffer with one byte per pixel, lines clipped to it
+    framebuffer = bytearray(width * height)
+    ones = memoryview(b"\1" * max(width, height))  # sliced without copying for every run
+    for rectangle in recs:
+        for line in rectangle:
+            x0, y0, x1, y1 = line.start.x, line.start.y, line.end.x, line.end.y
+            if y0 == y1 and 0 <= y0 < height:  # a row slice
+                left, right = max(min(x0, x1), 0), min(max(x0, x1), width - 1)
+                if left <= right:
+                    framebuffer[y0 * width + left:y0 * width + right + 1] = ones[:right - left + 1]
+            elif x0 == x1 and 0 <= x0 < width:  # a strided column slice
+                bottom, top = max(min(y0, y1), 0), min(max(y0, y1), height - 1)
+                if bottom <= top:
+                    framebuffer[bottom * width + x0:top * width + x0 + 1:width] = ones[:top - bottom + 1]
+            elif x0 != x1 and y0 != y1:
+                for p in LazyLineToPointAdapter(line):
+                    if 0 <= p.x < width and 0 <= p.y < height:
+                        framebuffer[p.y * width + p.x] = 1
+    return framebuffer
+
+
+def _rasterize_tile(line_coords):  # runs in a worker: flat x0, y0, x1, y1 bytes in -> flat x, y bytes out
+    coords = array("i")
+    coords.frombytes(line_coords)
+    lines = [Line(Point(coords[i], coords[i + 1]), Point(coords[i + 2], coords[i + 3]))
+             for i in range(0, len(coords), 4)]
+    return rasterize([lines]).tobytes()
+
+
+def rasterize_parallel(recs, workers=4, tile_size=256):
+    tiles = defaultdict(lambda: array("i"))  # rectangles grouped by the tile of their first corner
+    for rectangle in recs:
+        corner = rectangle[0].start
+        tile = tiles[corner.y // tile_size, corner.x // tile_size]
+        for line in rectangle:
+            tile.extend((line.start.x, line.start.y, line.end.x, line.end.y))
+
+    batches = [array("i") for _ in range(workers * 4)]  # a few batches per worker to even out the load
+    for i, key in enumerate(sorted(tiles)):
+        batches[i % len(batches)].extend(tiles[key])
+
+    coords = array("i")
+    with ProcessPoolExecutor(workers) as executor:
+        for result in executor.map(_rasterize_tile, (b.tobytes() for b in batches if b)):
+            coords.frombytes(result)
+    return coords
+
+
+def draw_parallel(recs, workers=4, sink=None):
+    sink = sink or PrintSink()
+    print("\n\n--- Drawing some staff in parallel ---\n")
+    coords = rasterize_parallel(recs, workers)
+    for i in range(0, len(coords), 2):
+        sink.draw_point(Point(coords[i], coords[i + 1]))
+    sink.flush()
 
 
 if __name__ == "__main__":
@@ -65,3 +233,18 @@ if __name__ == "__main__":
         Rectangle(3, 3, 6, 6)
     ]
     draw(rectangles)
+    draw_lazy(rectangles)
+    draw_lazy(rectangles, FramebufferSink(13, 13))
+    null_sink = NullSink()
+    draw_lazy(rectangles, null_sink)
+    print(null_sink.count, "points")
+
+    diagonal = LazyLineToPointAdapter(Line(Point(0, 0), Point(5, 2)))
+    print("\n", [(p.x, p.y) for p in diagonal])
+
+    print(len(rasterize(rectangles)) // 2, "points")
+    framebuffer = paint(rectangles, 13, 13)
+    for y in range(13):
+        print(framebuffer[y * 13:(y + 1) * 13].translate(b" ." + bytes(254)).decode())
+
+    draw_parallel(rectangles, workers=2, sink=FramebufferSink(13, 13))
@@ -8,8 +8,13 @@ Getting the interface you want from the interface you have.
 IMPORTANT: adapter_pattern mustn't change the underlying behavior of the adaptee - the idea is to get access to that behaviour.
 """
 
+import heapq
+import io
 import re
+from bisect import bisect_left, insort
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 
 text = """
 In software engineering, a design pattern is a general repeatable solution to a commonly occurring problem in software design. 
@@ -48,21 +53,182 @@ class WordCounter:
         return self.__words.copy()
 
 
+class StreamingWordCounter:  # same interface as WordCounter, but reads the text chunk by chunk
+    word = re.compile(r"\w+")  # the same words System.__init__ leaves behind after normalizing
+
+    def __init__(self, chunk_size=1 << 20):
+        self.chunk_size = chunk_size
+        self.__words = dict()
+
+    def count_stream(self, stream):  # memory bounded by chunk_size + vocabulary, not by the input size
+        self.__words = dict()
+        carry = ""  # a word that may continue in the next chunk
+        while True:
+            chunk = stream.read(self.chunk_size)
+            if not chunk:
+                break
+            chunk = carry + chunk.lower()
+            carry = ""
+            for match in self.word.finditer(chunk):
+                if match.end() == len(chunk):
+                    carry = match.group()
+                else:
+                    self.__words[match.group()] = self.__words.get(match.group(), 0) + 1
+        if carry:
+            self.__words[carry] = self.__words.get(carry, 0) + 1
+
+    def count_file(self, path, encoding="utf-8"):
+        with open(path, encoding=encoding) as f:
+            self.count_stream(f)
+
+    def count_words(self, text):
+        self.count_stream(io.StringIO(text))
+
+    def get_count(self, word):
+        return self.__words.get(word, 0)
+
+    def get_all_words(self):
+        return self.__words.copy()
+
+
 class WordCounterAdapter(TextProcessor):
     def __init__(self, adaptee):
         self.adaptee = adaptee
 
-    def process_text(self, text):
+    def process_text(self, text, top=None):  # ties keep first-occurrence order in both modes
         self.adaptee.count_words(text)
-        words = self.adaptee.get_all_words().keys()
-        return sorted(words,
-                      key=lambda x: self.adaptee.get_count(x),
-                      reverse=True)
+        counts = self.adaptee.get_all_words().items()
+        if top is None:
+            ranked = sorted(counts, key=itemgetter(1), reverse=True)
+        else:  # O(V log k) - only the k best words are kept in a heap
+            ranked = heapq.nlargest(top, counts, key=itemgetter(1))
+        return [word for word, _ in ranked]
+
+
+class IncrementalWordCounter:  # same interface as WordCounter, plus updates that only touch the changed words
+    def __init__(self):
+        self.__words = dict()
+        self.__first_seen = dict()  # word -> position of its first occurrence, the tie-breaker
+        self.__seen = 0
+        self.__buckets = dict()  # count -> sorted (first_seen, word) pairs with exactly that count
+        self.__counts = []  # sorted distinct counts
+
+    def __move(self, word, old, new):
+        if old:
+            bucket = self.__buckets[old]
+            del bucket[bisect_left(bucket, (self.__first_seen[word], word))]
+            if not bucket:
+                del self.__buckets[old]
+                del self.__counts[bisect_left(self.__counts, old)]
+        else:
+            self.__first_seen[word] = self.__seen
+            self.__seen += 1
+        if new:
+            if new not in self.__buckets:
+                self.__buckets[new] = []
+                insort(self.__counts, new)
+            insort(self.__buckets[new], (self.__first_seen[word], word))
+            self.__words[word] = new
+        else:
+            del self.__words[word]
+            del self.__first_seen[word]
+
+    def add_text(self, text):
+        for word in text.split():
+            old = self.__words.get(word, 0)
+            self.__move(word, old, old + 1)
+
+    def remove_text(self, text):
+        removed = dict()
+        for word in text.split():  # checking everything first, so a bad call leaves the counts untouched
+            removed[word] = removed.get(word, 0) + 1
+            if removed[word] > self.__words.get(word, 0):
+                raise ValueError(f"{word!r} has not been counted {removed[word]} time(s)")
+        for word, count in removed.items():
+            old = self.__words[word]
+            self.__move(word, old, old - count)
+
+    def count_words(self, text):
+        self.__init__()
+        self.add_text(text)
+
+    def ranked(self, top=None):  # walks the buckets from the highest count - ties in first-occurrence order
+        result = []
+        for count in reversed(self.__counts):
+            for _, word in self.__buckets[count]:
+                if len(result) == top:
+                    return result
+                result.append(word)
+        return result
+
+    def get_count(self, word):
+        return self.__words.get(word, 0)
+
+    def get_all_words(self):
+        return self.__words.copy()
+
+
+def _count_shard(shard):  # runs in a worker process
+    counter = WordCounter()
+    counter.count_words(shard)
+    return counter.get_all_words()
+
+
+def _merge_counts(pair):  # left words first, so ties keep their first-occurrence order
+    left, right = pair
+    for word, count in right.items():
+        left[word] = left.get(word, 0) + count
+    return left
+
+
+class ParallelWordCounter:  # same interface as WordCounter - map over shards, tree-reduce the partial counts
+    def __init__(self, workers=4, shards=None):
+        self.workers = workers
+        self.shards = shards or workers
+        self.__words = dict()
+
+    def _split(self, text):  # shard boundaries are moved forward to the next whitespace
+        size = max(len(text) // self.shards, 1)
+        start = 0
+        while start < len(text):
+            end = start + size
+            while end < len(text) and not text[end].isspace():
+                end += 1
+            yield text[start:end]
+            start = end
+
+    def count_words(self, text):
+        with ProcessPoolExecutor(self.workers) as executor:
+            partial = list(executor.map(_count_shard, self._split(text)))
+            while len(partial) > 1:  # log2(shards) levels of pairwise merges
+                pairs = list(zip(partial[::2], partial[1::2]))
+                leftover = [partial[-1]] if len(partial) % 2 else []
+                partial = list(executor.map(_merge_counts, pairs)) + leftover
+        self.__words = partial[0] if partial else dict()
+
+    def get_count(self, word):
+        return self.__words.get(word, 0)
+
+    def get_all_words(self):
+        return self.__words.copy()
+
+
+if __name__ == "__main__":
+    system = System(text)
+    counter = WordCounter()
 
+    adapter = WordCounterAdapter(counter)
+    system.get_processed_text(adapter)
 
-system = System(text)
-counter = WordCounter()
+    streaming_counter = StreamingWordCounter(chunk_size=64)
+    streaming_counter.count_stream(io.StringIO(text))
+    print(streaming_counter.get_all_words() == counter.get_all_words())
+    print(adapter.process_text(system.text, top=3))
 
-adapter = WordCounterAdapter(counter)
-system.get_processed_text(adapter)
+    parallel_adapter = WordCounterAdapter(ParallelWordCounter(workers=2))
+    system.get_processed_text(parallel_adapter)
 
+    incremental_counter = IncrementalWordCounter()
+    incremental_counter.count_words(system.text)
+    incremental_counter.add_text("design design pattern")
+    print(incremental_counter.ranked(top=3))
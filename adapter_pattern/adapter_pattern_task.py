@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from collections import deque
 
 
 class System:
@@ -18,26 +19,80 @@ class LightMapper(ABC):
 
 
 class Light:
-    def __init__(self, dim):  # dim = (map_width, map_height)
+    neighbours = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+    def __init__(self, dim, radius=8):  # dim = (map_width, map_height)
         self.dim = dim
+        self.radius = radius
         self.grid = [[0 for i in range(dim[0])] for _ in range(dim[1])]
         self.lights = []
         self.obstacles = []
+        self._dirty = True
 
     def set_dim(self, dim):
         self.dim = dim
         self.grid = [[0 for i in range(dim[0])] for _ in range(dim[1])]
+        self._dirty = True
 
     def set_lights(self, lights):  # lights = [(width, height), (width, height), ...]
         self.lights = lights
-        self.generate_lights()
+        self._dirty = True  # computed once, on the next generate_lights()
 
     def set_obstacles(self, obstacles):  # obstacles = [(width, height), (width, height), ...]
         self.obstacles = obstacles
-        self.generate_lights()
-
-    def generate_lights(self):
-        return self.grid.copy()
+        self._dirty = True
+
+    def generate_lights(self):  # BFS distance transform from all lights at once, walls stop the spread
+        if self._dirty:
+            self._propagate()
+            self._dirty = False
+        return [row.copy() for row in self.grid]
+
+    def _spread(self, lights):  # {(x, y): brightness} for every cell reached by the given lights
+        width, height = self.dim
+        blocked = set(self.obstacles)
+        distance = {}
+        queue = deque()
+        for light in lights:
+            if light not in blocked and light not in distance:
+                distance[light] = 0
+                queue.append(light)
+
+        while queue:
+            x, y = queue.popleft()
+            d = distance[x, y]
+            if (x, y) in blocked or d + 1 >= self.radius:
+                continue  # walls get lit but do not pass the light further
+            for dx, dy in self.neighbours:
+                if dx and dy and ((x + dx, y) in blocked or (x, y + dy) in blocked):
+                    continue  # no squeezing diagonally between two walls touching at a corner
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < width and 0 <= ny < height and (nx, ny) not in distance:
+                    distance[nx, ny] = d + 1
+                    queue.append((nx, ny))
+        return {cell: 1 - d / self.radius for cell, d in distance.items()}  # linear falloff, 1 at the light
+
+    def _propagate(self):
+        width, height = self.dim
+        self.grid = [[0 for i in range(width)] for _ in range(height)]
+        for (x, y), value in self._spread(self.lights).items():
+            self.grid[y][x] = value
+
+    def relight(self, tiles, tile_size):  # recomputes only the given (tile_x, tile_y) tiles of the last map
+        width, height = self.dim
+        boxes = [(tx * tile_size, ty * tile_size,
+                  min((tx + 1) * tile_size, width) - 1, min((ty + 1) * tile_size, height) - 1)
+                 for tx, ty in tiles]
+        reach = self.radius - 1  # light never travels further than this (Chebyshev distance)
+        near = [(x, y) for x, y in self.lights
+                if any(left - reach <= x <= right + reach and top - reach <= y <= bottom + reach
+                       for left, top, right, bottom in boxes)]
+        values = self._spread(near)
+        for left, top, right, bottom in boxes:
+            for y in range(top, bottom + 1):
+                self.grid[y][left:right + 1] = [values.get((x, y), 0) for x in range(left, right + 1)]
+        self._dirty = False
+        return [row.copy() for row in self.grid]
 
 
 class MappingAdapter:
@@ -45,22 +100,88 @@ class MappingAdapter:
         self.adaptee = adaptee
 
     @staticmethod
-    def _get_objects_by_grid(descriptor, grid):
-        result = []
-        for i in range(len(grid)):
-            for j in range(len(grid[0])):
-                if grid[i][j] == descriptor:
-                    result.append((j, i))
+    def _get_objects_by_grid(grid, descriptors=(1, -1)):  # one pass for all descriptors: {descriptor: [(x, y), ...]}
+        result = {descriptor: [] for descriptor in descriptors}
+        if hasattr(grid, "nonzero"):  # NumPy array - one vectorized pass, no list-of-lists conversion needed
+            rows, columns = grid.nonzero()
+            for i, j, cell in zip(rows.tolist(), columns.tolist(), grid[rows, columns].tolist()):
+                if cell in result:
+                    result[cell].append((j, i))
+            return result
+        for i, row in enumerate(grid):
+            if not any(row):
+                continue
+            for j, cell in enumerate(row):
+                if cell in result:
+                    result[cell].append((j, i))
         return result
 
     def lighten(self, grid):
         dim = (len(grid[0]), len(grid))
         self.adaptee.set_dim(dim)
-        lights = self._get_objects_by_grid(1, grid)
-        obstacles = self._get_objects_by_grid(-1, grid)
-        self.adaptee.set_lights(lights)
-        self.adaptee.set_obstacles(obstacles)
+        objects = self._get_objects_by_grid(grid)
+        self.adaptee.set_lights(objects[1])
+        self.adaptee.set_obstacles(objects[-1])
         return self.adaptee.generate_lights()
 
 
-system = System()
+class IncrementalMappingAdapter(MappingAdapter):  # remembers the last map and relights only what changed
+    def __init__(self, adaptee, tile_size=16):
+        super().__init__(adaptee)
+        self.tile_size = tile_size
+        self.previous = None
+        self.lights = set()
+        self.obstacles = set()
+        self.tiles_recomputed = 0  # during the last lighten() call
+
+    def lighten(self, grid):
+        rows = grid.tolist() if hasattr(grid, "tolist") else grid
+        dim = (len(rows[0]), len(rows))
+        if self.previous is None or dim != self.adaptee.dim:
+            self.previous = [list(row) for row in rows]
+            objects = self._get_objects_by_grid(rows)
+            self.lights, self.obstacles = set(objects[1]), set(objects[-1])
+            self.tiles_recomputed = (-(-dim[0] // self.tile_size)) * (-(-dim[1] // self.tile_size))
+            return super().lighten(rows)
+
+        changed = []
+        for y, (row, previous) in enumerate(zip(rows, self.previous)):
+            if row != previous:  # rows are compared in C, cells only inside the rows that differ
+                changed.extend((x, y) for x, (new, old) in enumerate(zip(row, previous)) if new != old)
+                self.previous[y] = list(row)
+        for x, y in changed:
+            cell = rows[y][x]
+            self.lights.discard((x, y))
+            self.obstacles.discard((x, y))
+            if cell == 1:
+                self.lights.add((x, y))
+            elif cell == -1:
+                self.obstacles.add((x, y))
+
+        reach = self.adaptee.radius - 1
+        affected = {(lx, ly) for lx, ly in self.lights.union(changed)  # changed cells cover removed lights
+                    if any(abs(lx - x) <= reach and abs(ly - y) <= reach for x, y in changed)}
+        tiles = set()
+        for lx, ly in affected:  # every tile the affected lights can reach
+            for ty in range(max(ly - reach, 0) // self.tile_size, min(ly + reach, dim[1] - 1) // self.tile_size + 1):
+                for tx in range(max(lx - reach, 0) // self.tile_size,
+                                min(lx + reach, dim[0] - 1) // self.tile_size + 1):
+                    tiles.add((tx, ty))
+        self.tiles_recomputed = len(tiles)
+
+        self.adaptee.set_lights(list(self.lights))
+        self.adaptee.set_obstacles(list(self.obstacles))
+        return self.adaptee.relight(tiles, self.tile_size)
+
+
+if __name__ == "__main__":
+    system = System()
+    system.get_lightening(MappingAdapter(Light((0, 0), radius=6)))
+    for row in system.lightmap[1:10]:
+        print(" ".join(f"{cell:.2f}" for cell in row[:12]))
+
+    incremental_adapter = IncrementalMappingAdapter(Light((0, 0), radius=6), tile_size=4)
+    system.get_lightening(incremental_adapter)
+    system.map[5][5] = -1  # one new wall
+    system.get_lightening(incremental_adapter)
+    print(f"{incremental_adapter.tiles_recomputed} tiles recomputed")
@@ -1,3 +1,9 @@
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+
+from adapter_no_caching import FramebufferSink, NullSink, PointSink
+
+
 class Point:
     def __init__(self, x, y):
         self.x = x
@@ -10,6 +16,11 @@ def draw_point(p):
 # ^^^ we are given this API ^^^
 
 
+class PrintSink(PointSink):  # the given API behind the same sinks as in adapter_no_caching
+    def draw_point(self, p):
+        draw_point(p)
+
+
 # our existing API
 class Line:
     def __init__(self, start, end):
@@ -27,13 +38,21 @@ class Rectangle(list):
 
 
 class LineToPointAdapter:  # adapter
-    cache = {}
+    cache = OrderedDict()  # least recently used lines first
+    max_size = 1024
+    hits = misses = evictions = 0
 
     def __init__(self, line):
         super().__init__()
-        self.h = hash(line)
+        if self.max_size < 1:
+            raise ValueError("LineToPointAdapter.max_size must be at least 1")
+        self.h = (line.start.x, line.start.y, line.end.x, line.end.y)  # equal lines share an entry
         if self.h in self.cache:
+            self.cache.move_to_end(self.h)
+            self.points = self.cache[self.h]  # kept on the instance - the entry may be evicted before iteration
+            LineToPointAdapter.hits += 1
             return
+        LineToPointAdapter.misses += 1
 
         print(f"Generating points for line "
               f"[{line.start.x}, {line.start.y}]->"
@@ -47,25 +66,119 @@ class LineToPointAdapter:  # adapter
         points = []
 
         if right - left == 0:
-            for y in range(top, bottom):
+            for y in range(bottom, top):
                 points.append(Point(left, y))
         elif line.end.y - line.start.y == 0:
             for x in range(left, right):
                 points.append(Point(x, top))
 
+        self.points = points
         self.cache[self.h] = points
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+            LineToPointAdapter.evictions += 1
 
     def __iter__(self):
-        return iter(self.cache[self.h])
+        return iter(self.points)
+
+    @classmethod
+    def stats(cls):
+        return {"hits": cls.hits, "misses": cls.misses, "evictions": cls.evictions, "size": len(cls.cache)}
 
 
-def draw(recs):
+def draw(recs, sink=None):
+    sink = sink or PrintSink()
     print("\n\n--- Drawing some staff ---\n")
     for rectangle in recs:
         for line in rectangle:
             adapter = LineToPointAdapter(line)
             for p in adapter:  # completing adapter
-                draw_point(p)  # using initial API to which we adapted our system
+                sink.draw_point(p)  # using initial API to which we adapted our system
+    sink.flush()
+
+
+class SegmentIndex:  # merges collinear overlapping lines so that shared edges are adapted once
+    def __init__(self, recs):
+        rows, columns = defaultdict(list), defaultdict(list)
+        self.others = []
+        self.lines_in = self.points_in = 0
+        for rectangle in recs:
+            for line in rectangle:
+                self.lines_in += 1
+                x0, y0, x1, y1 = line.start.x, line.start.y, line.end.x, line.end.y
+                if y0 == y1:  # same half-open ranges as LineToPointAdapter: [left, right), [bottom, top)
+                    rows[y0].append((min(x0, x1), max(x0, x1)))
+                    self.points_in += abs(x1 - x0)
+                elif x0 == x1:
+                    columns[x0].append((min(y0, y1), max(y0, y1)))
+                    self.points_in += abs(y1 - y0)
+                else:
+                    self.others.append(line)
+        self.rows = {y: self._merge(intervals) for y, intervals in rows.items()}
+        self.columns = {x: self._merge(intervals) for x, intervals in columns.items()}
+
+    @staticmethod
+    def _merge(intervals):  # sorted, non-overlapping (starts, ends) of the union
+        starts, ends = [], []
+        for start, end in sorted(intervals):
+            if start >= end:
+                continue
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        return starts, ends
+
+    def row_covers(self, x, y):
+        if y not in self.rows:
+            return False
+        starts, ends = self.rows[y]
+        i = bisect_right(starts, x) - 1
+        return i >= 0 and x < ends[i]
+
+    def horizontal_lines(self):
+        for y, (starts, ends) in self.rows.items():
+            for left, right in zip(starts, ends):
+                yield Line(Point(left, y), Point(right, y))
+
+    def vertical_lines(self):
+        for x, (starts, ends) in self.columns.items():
+            for bottom, top in zip(starts, ends):
+                yield Line(Point(x, bottom), Point(x, top))
+
+
+def draw_deduplicated(recs, sink=None):
+    sink = sink or PrintSink()
+    print("\n\n--- Drawing some staff once per pixel ---\n")
+    index = SegmentIndex(recs)
+    lines_out = points_out = 0
+    for line in index.horizontal_lines():
+        lines_out += 1
+        for p in LineToPointAdapter(line):
+            points_out += 1
+            sink.draw_point(p)
+    for line in index.vertical_lines():
+        lines_out += 1
+        for p in LineToPointAdapter(line):
+            if not index.row_covers(p.x, p.y):  # crossing already drawn by a horizontal line
+                points_out += 1
+                sink.draw_point(p)
+    for line in index.others:
+        lines_out += 1
+        for p in LineToPointAdapter(line):
+            points_out += 1
+            sink.draw_point(p)
+    stats = {
+        "lines_in": index.lines_in,
+        "lines_adapted": lines_out,
+        "points_in": index.points_in,
+        "points_drawn": points_out,
+        "points_saved": index.points_in - points_out,
+    }
+    sink.flush()
+    print(f"\n{stats}")
+    return stats
 
 
 if __name__ == "__main__":
@@ -74,4 +187,11 @@ if __name__ == "__main__":
         Rectangle(3, 3, 6, 6)
     ]
     draw(rectangles)
-    draw(rectangles)
+    draw([Rectangle(1, 1, 10, 10)])  # equal lines built as new objects still hit the cache
+    print(f"\n{LineToPointAdapter.stats()}")
+
+    draw_deduplicated(rectangles + [Rectangle(1, 1, 10, 5)])
+    draw_deduplicated(rectangles + [Rectangle(1, 1, 10, 5)], FramebufferSink(12, 12))
+    null_sink = NullSink()
+    draw(rectangles, null_sink)
+    print(null_sink.count, "points")
@@ -7,43 +7,259 @@ Composite pattern composes objects into tree structures to represent part-whole
 further divided into smaller components).
 It lets clients treat individual objects and compositions of objects uniformly.
 """
+import io
+import sys
+from collections import Counter
+
+
+class ChildList(list):  # children list that tells its owner about every change
+    def __init__(self, owner):
+        super().__init__()
+        self.owner = owner
+
+    def _adopt(self, children):
+        for child in children:
+            child.parent = self.owner
+        self.owner._invalidate()
+
+    def _release(self, children):  # only children that are really gone - the same child may be listed twice
+        remaining = set(map(id, self))
+        for child in children:
+            if id(child) not in remaining:
+                child.parent = None
+        self.owner._invalidate()
+
+    def append(self, child):
+        super().append(child)
+        self._adopt([child])
+
+    def insert(self, index, child):
+        super().insert(index, child)
+        self._adopt([child])
+
+    def extend(self, children):
+        children = list(children)
+        super().extend(children)
+        self._adopt(children)
+
+    def __iadd__(self, children):
+        self.extend(children)
+        return self
+
+    def __imul__(self, n):
+        children = list(self)
+        super().__imul__(n)
+        self._release(children)  # n < 1 empties the list, otherwise this only drops the cached aggregates
+        return self
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            old, value = self[index], list(value)  # value may be a one-shot iterator
+        else:
+            old = [self[index]]
+        super().__setitem__(index, value)
+        self._adopt(value if isinstance(index, slice) else [value])
+        self._release(old)
+
+    def __delitem__(self, index):
+        old = self[index] if isinstance(index, slice) else [self[index]]
+        super().__delitem__(index)
+        self._release(old)
+
+    def remove(self, child):
+        super().remove(child)
+        self._release([child])
+
+    def pop(self, index=-1):
+        child = super().pop(index)
+        self._release([child])
+        return child
+
+    def clear(self):
+        old = list(self)
+        super().clear()
+        self._release(old)
 
 
 class GraphicObject:
+    is_shape = False
+
     def __init__(self, color=None):
-        self.color = color
-        self.children = []
+        self._cache = {}  # per-subtree aggregates, dropped up the parent chain on any change
+        self.parent = None
+        self._color = color
+        self.children = ChildList(self)
         self._name = "Group"
 
     @property
     def name(self):
         return self._name
 
-    def _print(self, items, depth):
-        items.append("*" * depth)
-        if self.color:
-            items.append(self.color)
-        items.append(f"{self.name}\n")
-        for child in self.children:
-            child._print(items, depth + 1)
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, value):
+        self._color = value
+        self._invalidate(self.color_keys)
+
+    color_keys = ("color_counts",)  # aggregates that depend on colors only
+
+    def _invalidate(self, keys=None):  # keys=None - structural change, everything goes
+        node = self
+        while node is not None:
+            if keys is None:
+                if not node._cache:  # an empty cache means the ancestors are already clean
+                    return
+                node._cache.clear()
+            else:
+                if not any(key in node._cache for key in keys):  # same, for just these keys
+                    return
+                for key in keys:
+                    node._cache.pop(key, None)
+            node = node.parent
+
+    def _geometry_changed(self):  # a shape moved or was resized: bounds go, cached spatial indexes follow the shape
+        node = self
+        while node is not None:  # no early stop - an index may sit above nodes whose bounds are already gone
+            node._cache.pop("bounds", None)
+            if "spatial_index" in node._cache:
+                node._cache["spatial_index"].update(self)
+            node = node.parent
+
+    def _combine(self, key, children):
+        if key == "size":
+            return 1 + sum(children)
+        if key == "height":
+            return 1 + max(children, default=0)
+        if key == "color_counts":
+            counts = Counter({self.color: 1} if self.is_shape else {})
+            for child in children:
+                counts.update(child)
+            return counts
+        if key == "bounds":  # (left, top, right, bottom) of everything in the subtree, None without geometry
+            boxes = [box for box in [self.own_bounds()] + children if box]
+            if not boxes:
+                return None
+            return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                    max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+    def _aggregate(self, key):  # post-order with an explicit stack, computing only subtrees without a cached value
+        stack = [(self, False)]
+        while stack:
+            node, children_ready = stack.pop()
+            if key in node._cache:
+                continue
+            if children_ready:
+                node._cache[key] = node._combine(key, [child._cache[key] for child in node.children])
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+        return self._cache[key]
+
+    def size(self):
+        return self._aggregate("size")
+
+    def height(self):
+        return self._aggregate("height")
+
+    def color_counts(self):  # number of shapes per color
+        return dict(self._aggregate("color_counts"))
+
+    def own_bounds(self):
+        return None
+
+    def contains(self, x, y):
+        return False
+
+    def bounds(self):
+        return self._aggregate("bounds")
+
+    def write_to(self, stream):  # explicit stack instead of recursion - any depth, lines streamed one by one
+        stack = [(iter([self]), 0)]  # one children iterator per level, so extra memory is O(depth)
+        while stack:
+            children, depth = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+                continue
+            stream.write(f"{'*' * depth}{node.color or ''}{node.name}\n")
+            if node.children:
+                stack.append((iter(node.children), depth + 1))
 
     def __str__(self):
-        items = []
-        self._print(items, 0)
-        return "".join(items)
+        items = io.StringIO()
+        self.write_to(items)
+        return items.getvalue()
+
+
+def _geometry_property(name):  # plain attribute that reports every assignment as a geometry change
+    attribute = "_" + name
+
+    def getter(self):
+        return getattr(self, attribute)
+
+    def setter(self, value):
+        setattr(self, attribute, value)
+        self._geometry_changed()
+
+    return property(getter, setter)
 
 
 class Circle(GraphicObject):
+    is_shape = True
+    x = _geometry_property("x")
+    y = _geometry_property("y")
+    radius = _geometry_property("radius")
+
+    def __init__(self, color=None, x=None, y=None, radius=0):  # center and radius; no x/y - no geometry
+        super().__init__(color)
+        self.x, self.y, self.radius = x, y, radius
+
+    def move_to(self, x, y):  # one geometry change, not two
+        self._x, self._y = x, y
+        self._geometry_changed()
+
     @property
     def name(self):
         return "Circle"
 
+    def own_bounds(self):
+        if self.x is None:
+            return None
+        return self.x - self.radius, self.y - self.radius, self.x + self.radius, self.y + self.radius
+
+    def contains(self, x, y):
+        return self.x is not None and (x - self.x) ** 2 + (y - self.y) ** 2 <= self.radius ** 2
+
 
 class Square(GraphicObject):
+    is_shape = True
+    x = _geometry_property("x")
+    y = _geometry_property("y")
+    side = _geometry_property("side")
+
+    def __init__(self, color=None, x=None, y=None, side=0):  # top-left corner and side; no x/y - no geometry
+        super().__init__(color)
+        self.x, self.y, self.side = x, y, side
+
+    def move_to(self, x, y):  # one geometry change, not two
+        self._x, self._y = x, y
+        self._geometry_changed()
+
     @property
     def name(self):
         return "Square"
 
+    def own_bounds(self):
+        if self.x is None:
+            return None
+        return self.x, self.y, self.x + self.side, self.y + self.side
+
+    def contains(self, x, y):
+        return self.x is not None and self.x <= x <= self.x + self.side and self.y <= y <= self.y + self.side
+
 
 if __name__ == "__main__":
     drawing = GraphicObject()
@@ -58,3 +274,16 @@ if __name__ == "__main__":
     drawing.children.append(group)
 
     print(drawing)
+
+    deep = GraphicObject()
+    node = deep
+    for _ in range(10000):  # far deeper than the recursion limit
+        child = GraphicObject()
+        node.children.append(child)
+        node = child
+    deep.write_to(io.StringIO())
+    drawing.write_to(sys.stdout)
+
+    print(drawing.color_counts(), drawing.size(), drawing.height())
+    group.children[0].color = "Green"  # only "group" and "drawing" caches are dropped
+    print(drawing.color_counts())
@@ -0,0 +1,188 @@
+"""
+The same composite drawing stored as parallel arrays instead of one Python object per shape.
+Node i is described by kinds[i], colors[i], parents[i], first_children[i] and next_siblings[i];
+-1 means "no node". Whole-tree operations become loops over a few compact arrays, and a subtree stored in
+consecutive slots [i, subtree_ends[i]) is handled with a single slice operation instead of a walk.
+
+Clients that expect the composite interface get NodeView objects - GraphicObject-compatible views
+created on demand over a single index.
+"""
+import sys
+from array import array
+from collections import Counter
+
+from composite_pattern import Circle, GraphicObject, Square
+
+
+class SceneGraph:
+    kind_names = ["Group", "Circle", "Square"]
+    kind_ids = {GraphicObject: 0, Circle: 1, Square: 2}
+
+    def __init__(self):
+        self.kinds = array("B")
+        self.colors = array("I")  # 0 = no color, otherwise index + 1 into color_names
+        self.parents = array("i")
+        self.first_children = array("i")
+        self.last_children = array("i")  # lets add() append a child in O(1)
+        self.next_siblings = array("i")
+        self.subtree_ends = array("i")  # one past the subtree's last slot, -1 once it is no longer consecutive
+        self.color_names = []
+        self.color_ids = {}
+        self.names = {}  # only groups that were given a custom name
+
+    def _color_id(self, color):
+        if not color:
+            return 0
+        if color not in self.color_ids:
+            self.color_names.append(color)
+            self.color_ids[color] = len(self.color_names)
+        return self.color_ids[color]
+
+    def _append(self, kind, color, parent):
+        index = len(self.kinds)
+        self.kinds.append(kind)
+        self.colors.append(self._color_id(color))
+        self.parents.append(parent)
+        self.first_children.append(-1)
+        self.last_children.append(-1)
+        self.next_siblings.append(-1)
+        self.subtree_ends.append(index + 1)
+        if parent >= 0:
+            if self.first_children[parent] < 0:
+                self.first_children[parent] = index
+            else:
+                self.next_siblings[self.last_children[parent]] = index
+            self.last_children[parent] = index
+        return index
+
+    def add(self, kind, color=None, parent=-1):
+        index = self._append(kind, color, parent)
+        ends = self.subtree_ends
+        while parent >= 0:  # ancestors ending right here grow by one slot, the others are split from now on
+            ends[parent] = index + 1 if ends[parent] == index else -1
+            parent = self.parents[parent]
+        return index
+
+    @classmethod
+    def from_object(cls, root):  # pre-order, so every subtree ends up in consecutive slots
+        graph = cls()
+        stack = [(root, -1)]
+        while stack:
+            node, parent = stack.pop()
+            index = graph._append(graph.kind_ids.get(type(node), 0), node.color, parent)
+            if node.name != graph.kind_names[graph.kinds[index]]:
+                graph.names[index] = node.name
+            stack.extend((child, index) for child in reversed(node.children))
+        ends, parents = graph.subtree_ends, graph.parents
+        for index in range(len(graph) - 1, 0, -1):  # children come after their parents - one backward pass
+            parent = parents[index]
+            ends[parent] = max(ends[parent], ends[index])
+        return graph
+
+    def view(self, index=0):
+        return NodeView(self, index)
+
+    def walk(self, index=0):  # depth-first (index, depth) pairs without recursion or per-node objects
+        first_children, next_siblings, parents = self.first_children, self.next_siblings, self.parents
+        node, depth = index, 0
+        while True:
+            yield node, depth
+            if first_children[node] >= 0:
+                node, depth = first_children[node], depth + 1
+                continue
+            while depth > 0 and next_siblings[node] < 0:
+                node, depth = parents[node], depth - 1
+            if depth == 0:
+                return
+            node = next_siblings[node]
+
+    def count_by_type(self):  # array.count runs in C
+        return {name: self.kinds.count(kind) for kind, name in enumerate(self.kind_names)}
+
+    def recolor_subtree(self, index, color):
+        color_id = self._color_id(color)
+        end = self.subtree_ends[index]
+        if end >= 0:  # consecutive slots - one slice assignment, done in C
+            self.colors[index:end] = array("I", [color_id]) * (end - index)
+            return
+        for node, _ in self.walk(index):
+            self.colors[node] = color_id
+
+    def write_to(self, stream, index=0):
+        for node, depth in self.walk(index):
+            color = self.color_names[self.colors[node] - 1] if self.colors[node] else ""
+            name = self.names.get(node) or self.kind_names[self.kinds[node]]
+            stream.write(f"{'*' * depth}{color}{name}\n")
+
+    def __len__(self):
+        return len(self.kinds)
+
+
+class NodeView(GraphicObject):  # looks like a GraphicObject, owns nothing but an index
+    def __init__(self, graph, index):
+        self._cache = {}  # stays empty - aggregates below are computed straight from the arrays
+        self.graph = graph
+        self.index = index
+
+    @property
+    def parent(self):
+        parent = self.graph.parents[self.index]
+        return NodeView(self.graph, parent) if parent >= 0 else None
+
+    def size(self):
+        return sum(1 for _ in self.graph.walk(self.index))
+
+    def height(self):
+        return 1 + max(depth for _, depth in self.graph.walk(self.index))
+
+    def color_counts(self):  # number of shapes per color
+        counts = Counter()
+        for node, _ in self.graph.walk(self.index):
+            if self.graph.kinds[node]:
+                color_id = self.graph.colors[node]
+                counts[self.graph.color_names[color_id - 1] if color_id else None] += 1
+        return dict(counts)
+
+    def bounds(self):  # the flat graph stores no geometry
+        return None
+
+    @property
+    def color(self):
+        color_id = self.graph.colors[self.index]
+        return self.graph.color_names[color_id - 1] if color_id else None
+
+    @color.setter
+    def color(self, value):
+        self.graph.colors[self.index] = self.graph._color_id(value)
+
+    @property
+    def name(self):
+        return self.graph.names.get(self.index) or self.graph.kind_names[self.graph.kinds[self.index]]
+
+    @property
+    def children(self):  # read-only - new nodes go through SceneGraph.add()
+        result = []
+        child = self.graph.first_children[self.index]
+        while child >= 0:
+            result.append(NodeView(self.graph, child))
+            child = self.graph.next_siblings[child]
+        return tuple(result)
+
+
+if __name__ == "__main__":
+    drawing = GraphicObject()
+    drawing._name = "My Drawing"
+    drawing.children.append(Square("Red"))
+    drawing.children.append(Circle("Yellow"))
+
+    group = GraphicObject()
+    group.children.append(Circle("Blue"))
+    group.children.append(Square("Blue"))
+
+    drawing.children.append(group)
+
+    graph = SceneGraph.from_object(drawing)
+    print(graph.count_by_type())
+    graph.recolor_subtree(3, "Green")
+    graph.write_to(sys.stdout)
+    print(graph.view())
@@ -0,0 +1,174 @@
+"""
+Hit-testing a composite drawing without visiting every shape: the shapes are bulk-loaded into an R-tree
+(Sort-Tile-Recursive packing), so a point or window query only descends into boxes that can match.
+
+The index is kept in the root's aggregate cache. Structural changes (adding/removing children) drop it and the
+next query rebuilds it; recoloring keeps it. A moved or resized shape only moves its own entry - out of its old
+leaf and into the one that needs the least enlargement, fixing the boxes on both paths in O(log n) - and the tree
+is repacked only after many such updates.
+"""
+from math import ceil, sqrt
+
+from composite_pattern import Circle, GraphicObject, Square
+
+
+def _union(boxes):
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _enlargement(box, extra):  # area a box gains by also covering extra
+    union = _union([box, extra])
+    return (union[2] - union[0]) * (union[3] - union[1]) - (box[2] - box[0]) * (box[3] - box[1])
+
+
+class RTreeNode:  # entries are [box, shape] pairs in leaves, child nodes above
+    __slots__ = ("box", "leaf", "entries", "parent")
+
+    def __init__(self, leaf, entries):
+        self.leaf = leaf
+        self.entries = entries
+        self.parent = None
+        self.box = _union([entry[0] for entry in entries] if leaf else [child.box for child in entries])
+        if not leaf:
+            for child in entries:
+                child.parent = self
+
+
+class SpatialIndex:
+    capacity = 16  # entries per R-tree node
+
+    def __init__(self, root):
+        self.drawing = root
+        self._build()
+
+    @classmethod
+    def of(cls, root):  # cached index of a drawing
+        if "spatial_index" not in root._cache:
+            root._cache["spatial_index"] = cls(root)
+        return root._cache["spatial_index"]
+
+    def _build(self):
+        self.drawing.size()  # fills every cache below, so structural changes reach the root and drop this index
+        entries = []  # [bounds, shape] for every shape that has geometry
+        stack = [self.drawing]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children)
+            box = node.own_bounds()
+            if box:
+                entries.append([box, node])
+        self.size = len(entries)
+        self.updates = 0  # moves and resizes since the last packing
+        self._overfull = False
+        self._leaves = {}  # id(shape) -> leaf holding its entry
+        self.root = self._pack(entries, leaf=True) if entries else None
+
+    def _pack(self, entries, leaf):  # one STR level, then recurse on the resulting nodes
+        box_of = (lambda e: e[0]) if leaf else (lambda node: node.box)
+        node_count = ceil(len(entries) / self.capacity)
+        slice_size = self.capacity * ceil(sqrt(node_count))
+        entries = sorted(entries, key=lambda e: box_of(e)[0] + box_of(e)[2])  # by center x
+        nodes = []
+        for i in range(0, len(entries), slice_size):
+            vertical_slice = sorted(entries[i:i + slice_size], key=lambda e: box_of(e)[1] + box_of(e)[3])  # by center y
+            for j in range(0, len(vertical_slice), self.capacity):
+                nodes.append(RTreeNode(leaf, vertical_slice[j:j + self.capacity]))
+                if leaf:
+                    for _, shape in nodes[-1].entries:
+                        self._leaves[id(shape)] = nodes[-1]
+        if len(nodes) == 1:
+            return nodes[0]
+        return self._pack(nodes, leaf=False)
+
+    def update(self, shape):  # called by the drawing whenever a shape below it moves or is resized
+        self.updates += 1
+        if self.loose:
+            return  # repacked before the next query anyway
+        leaf = self._leaves.pop(id(shape), None)
+        if leaf is not None:  # out of its old leaf, whose boxes shrink back on the way up
+            leaf.entries = [entry for entry in leaf.entries if entry[1] is not shape]
+            self.size -= 1
+            self._refit(leaf)
+        box = shape.own_bounds()
+        if box is None:
+            return
+        if self.root is None:
+            self.root = RTreeNode(True, [[box, shape]])
+            self._leaves[id(shape)] = self.root
+            self.size += 1
+            return
+        leaf = self.root  # and into the leaf that needs the least enlargement
+        while not leaf.leaf:
+            leaf = min(leaf.entries, key=lambda child: _enlargement(child.box, box))
+        leaf.entries.append([box, shape])
+        self._leaves[id(shape)] = leaf
+        self.size += 1
+        self._overfull = self._overfull or len(leaf.entries) > 2 * self.capacity
+        node = leaf
+        while node is not None and _union([node.box, box]) != node.box:  # grow the boxes up to the first covering one
+            node.box = _union([node.box, box])
+            node = node.parent
+
+    @property
+    def loose(self):  # too many updates or an overfull leaf - a fresh packing pays off
+        return self.updates > max(self.capacity, self.size // 4) or self._overfull
+
+    @staticmethod
+    def _refit(node):
+        while node is not None and node.entries:
+            box = _union([entry[0] for entry in node.entries] if node.leaf else [child.box for child in node.entries])
+            if box == node.box:
+                return
+            node.box = box
+            node = node.parent
+
+    def _search(self, box, hit):
+        if self.loose:
+            self._build()
+        if self.root is None:
+            return []
+        result = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if not _intersects(node.box, box):
+                continue
+            if node.leaf:
+                result.extend(shape for shape_box, shape in node.entries if _intersects(shape_box, box) and hit(shape))
+            else:
+                stack.extend(node.entries)
+        return result
+
+    def at_point(self, x, y):  # shapes actually covering the point, not just their boxes
+        return self._search((x, y, x, y), lambda shape: shape.contains(x, y))
+
+    def in_window(self, left, top, right, bottom):  # shapes whose bounding boxes intersect the window
+        return self._search((left, top, right, bottom), lambda shape: True)
+
+
+if __name__ == "__main__":
+    drawing = GraphicObject()
+    drawing._name = "My Drawing"
+    drawing.children.append(Square("Red", 0, 0, 10))
+    drawing.children.append(Circle("Yellow", 20, 5, 4))
+
+    group = GraphicObject()
+    group.children.append(Circle("Blue", 8, 8, 3))
+    group.children.append(Square("Blue", 30, 30, 5))
+    drawing.children.append(group)
+
+    index = SpatialIndex.of(drawing)
+    print([f"{s.color}{s.name}" for s in index.at_point(9, 9)])
+    print([f"{s.color}{s.name}" for s in index.in_window(15, 0, 40, 40)])
+
+    drawing.children[0].color = "Green"  # colors do not affect geometry - the index is kept
+    print(SpatialIndex.of(drawing) is index)
+    group.children[1].move_to(0, 0)  # the moved shape's entry is updated in place
+    print(SpatialIndex.of(drawing) is index, [f"{s.color}{s.name}" for s in index.at_point(1, 1)])
+    drawing.children.append(Circle("Red", 50, 50, 2))  # structural change - the next query rebuilds
+    print(SpatialIndex.of(drawing) is index)
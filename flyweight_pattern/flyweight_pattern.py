@@ -18,6 +18,12 @@ Implementation:
 """
 import string
 import random
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
 
 
 class User:
@@ -26,21 +32,241 @@ class User:
 
 
 class User2:
-    strings = []
+    strings = []  # id -> string (append-only, so ids stay valid)
+    string_ids = {}  # string -> id (O(1) lookups instead of list.index())
 
     def __init__(self, full_name):  # format: first_name last_name
-        def get_or_add(s):  # storing indices to parts of the string
-            if s in self.strings:
-                return self.strings.index(s)
-            else:
-                self.strings.append(s)
-                return len(self.strings) - 1
-        self.names = [get_or_add(x) for x in full_name.split(" ")]
+        self.names = [self.get_or_add(x) for x in full_name.split(" ")]
+
+    @classmethod
+    def get_or_add(cls, s):  # storing indices to parts of the string
+        idx = cls.string_ids.get(s)
+        if idx is None:
+            idx = len(cls.strings)
+            cls.strings.append(s)
+            cls.string_ids[s] = idx
+        return idx
+
+    @classmethod
+    def from_full_names(cls, full_names):
+        return [cls(full_name) for full_name in full_names]
+
+    @classmethod
+    def memory_report(cls, users):
+        pool_size = sys.getsizeof(cls.strings) + sys.getsizeof(cls.string_ids) \
+            + sum(sys.getsizeof(s) for s in cls.strings)
+        users_size = sum(sys.getsizeof(u) + sys.getsizeof(u.__dict__) + sys.getsizeof(u.names)
+                         for u in users)
+        total = pool_size + users_size
+        return {
+            "users": len(users),
+            "distinct_strings": len(cls.strings),
+            "pool_bytes": pool_size,
+            "total_bytes": total,
+            "bytes_per_user": total / len(users) if users else 0,
+        }
 
     def __str__(self):
         return " ".join([self.strings[x] for x in self.names])
 
 
+class UserTable:  # columnar store - no per-user objects at all, just arrays of string ids and row ids
+    def __init__(self):
+        self.strings = []
+        self.string_ids = {}
+        self.first_names = array("I")  # 4 bytes per user per column
+        self.last_names = array("I")
+        self.rows_by_last_name = {}  # last name id -> array("I") of row ids, another 4 bytes per user
+
+    def get_or_add(self, s):
+        idx = self.string_ids.get(s)
+        if idx is None:
+            idx = len(self.strings)
+            self.strings.append(s)
+            self.string_ids[s] = idx
+        return idx
+
+    def add(self, full_name):  # format: first_name last_name, where the first name may have spaces of its own
+        first, space, last = full_name.rpartition(" ")
+        if not space:
+            raise ValueError(f"expected 'first_name last_name', got {full_name!r}")
+        row = len(self.first_names)
+        last_id = self.get_or_add(last)
+        self.first_names.append(self.get_or_add(first))
+        self.last_names.append(last_id)
+        self.rows_by_last_name.setdefault(last_id, array("I")).append(row)
+        return row
+
+    @classmethod
+    def from_full_names(cls, full_names):
+        table = cls()
+        for full_name in full_names:
+            table.add(full_name)
+        return table
+
+    def with_last_name(self, last_name):  # O(result) - the matching rows are already listed
+        idx = self.string_ids.get(last_name)
+        if idx is None:
+            return []
+        return [UserRow(self, i) for i in self.rows_by_last_name.get(idx, ())]
+
+    def memory_report(self):
+        columns_size = sys.getsizeof(self.first_names) + sys.getsizeof(self.last_names) \
+            + sys.getsizeof(self.rows_by_last_name) \
+            + sum(sys.getsizeof(rows) for rows in self.rows_by_last_name.values())
+        pool_size = sys.getsizeof(self.strings) + sys.getsizeof(self.string_ids) \
+            + sum(sys.getsizeof(s) for s in self.strings)
+        users = len(self)
+        return {
+            "users": users,
+            "distinct_strings": len(self.strings),
+            "pool_bytes": pool_size,
+            "total_bytes": columns_size + pool_size,
+            "bytes_per_user": (columns_size + pool_size) / users if users else 0,
+        }
+
+    def to_bytes(self):  # header | string offsets | utf-8 blob | first/last name ids | rows grouped by last name
+        encoded = [s.encode("utf-8") for s in self.strings]
+        offsets = array("I", [0])
+        for e in encoded:
+            offsets.append(offsets[-1] + len(e))
+        blob = b"".join(encoded)
+        padding = b"\0" * (-len(blob) % 4)  # keeping id columns 4-byte aligned
+        row_starts, rows = array("I", [0]), array("I")  # last name i: rows[row_starts[i]:row_starts[i + 1]]
+        for idx in range(len(self.strings)):
+            rows.extend(self.rows_by_last_name.get(idx, ()))
+            row_starts.append(len(rows))
+        return b"".join([
+            MappedUserTable.header.pack(MappedUserTable.magic, len(self.strings), len(self), len(blob)),
+            offsets.tobytes(),
+            blob + padding,
+            self.first_names.tobytes(),
+            self.last_names.tobytes(),
+            row_starts.tobytes(),
+            rows.tobytes(),
+        ])
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    def __len__(self):
+        return len(self.first_names)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("user index out of range")
+        return UserRow(self, index % len(self))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield UserRow(self, i)
+
+
+class UserRow:  # lightweight view - created on demand, not stored
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def first_name(self):
+        return self.table.strings[self.table.first_names[self.index]]
+
+    @property
+    def last_name(self):
+        return self.table.strings[self.table.last_names[self.index]]
+
+    def __str__(self):
+        return f"{self.first_name} {self.last_name}"
+
+
+class MappedStrings:  # read-only string pool decoded lazily straight from the mapped file
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+        self._ids = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        return str(self.blob[self.offsets[idx]:self.offsets[idx + 1]], "utf-8")
+
+    def find(self, s):  # the first lookup builds a bytes -> id dict, so later ones cost O(1)
+        if self._ids is None:
+            self._ids = {bytes(self.blob[self.offsets[idx]:self.offsets[idx + 1]]): idx for idx in range(len(self))}
+        return self._ids.get(s.encode("utf-8"))
+
+
+class MappedUserTable:  # UserTable reopened from disk - nothing is copied or decoded up front
+    magic = b"FLY2"
+    header = struct.Struct("=4sIII")  # magic, distinct strings, users, blob size
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._load(self._mmap, path)
+        except Exception:  # a bad file must not leave the map open
+            self._release()
+            self._mmap.close()
+            raise
+
+    def _load(self, source, name):
+        buffer = memoryview(source)
+        self._views = [buffer]  # every view is recorded as soon as it exists, so _release() can always run
+        magic, string_count, user_count, blob_size = self.header.unpack_from(buffer)
+        if magic != self.magic:
+            raise ValueError(f"{name} is not a flyweight user table")
+
+        sections = []  # offsets, blob, first name ids, last name ids, row starts, rows grouped by last name
+        pos = self.header.size
+        for size, fmt in ((4 * (string_count + 1), "I"), (blob_size, None), (4 * user_count, "I"),
+                          (4 * user_count, "I"), (4 * (string_count + 1), "I"), (4 * user_count, "I")):
+            if pos + size > len(buffer):
+                raise ValueError(f"{name} is truncated")
+            section = buffer[pos:pos + size]
+            self._views.append(section)
+            if fmt:
+                section = section.cast(fmt)
+                self._views.append(section)
+            sections.append(section)
+            pos += size + (-size % 4)
+        offsets, blob, self.first_names, self.last_names, self.row_starts, self.rows_by_last_name = sections
+        self.strings = MappedStrings(offsets, blob)
+
+    def with_last_name(self, last_name):  # O(result), like UserTable
+        idx = self.strings.find(last_name)
+        if idx is None:
+            return []
+        start, end = self.row_starts[idx], self.row_starts[idx + 1]
+        return [UserRow(self, self.rows_by_last_name[i]) for i in range(start, end)]
+
+    def _release(self):  # all views over the map have to be released before it can be closed
+        while self._views:
+            self._views.pop().release()
+
+    def close(self):
+        self._release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.first_names)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("user index out of range")
+        return UserRow(self, index % len(self))
+
+
 def random_string():
     chars = string.ascii_lowercase
     return "".join(
@@ -49,13 +275,22 @@ def random_string():
 
 
 if __name__ == "__main__":
-    users = []
-
     first_names = [random_string() for x in range(100)]
     last_names = [random_string() for x in range(100)]
 
-    for first in first_names:  # calculating Cartesian product - set of ordered first-last name pairs
-        for last in last_names:
-            users.append(User2(f"{first} {last}"))
+    users = User2.from_full_names(  # calculating Cartesian product - set of ordered first-last name pairs
+        f"{first} {last}" for first in first_names for last in last_names
+    )
 
     print(users[0])
+    print(User2.memory_report(users))
+
+    table = UserTable.from_full_names(f"{first} {last}" for first in first_names for last in last_names)
+    print(table[0], len(table.with_last_name(last_names[0])))
+    print(table.memory_report())
+
+    with tempfile.TemporaryDirectory() as directory:  # removed with everything in it afterwards
+        path = os.path.join(directory, "users.flyw")
+        table.save(path)
+        with MappedUserTable(path) as mapped:
+            print(mapped[0], len(mapped.with_last_name(last_names[0])))
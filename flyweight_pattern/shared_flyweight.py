@@ -0,0 +1,103 @@
+"""
+Flyweight shared between processes: the intern pool and the name id columns are published once into a
+shared memory block, and every worker reads them in place instead of holding its own copy.
+
+Only one process (the writer) is allowed to change the table. Workers that want to add a user send the
+name to the writer through a queue; the writer adds pending names and publishes a new block.
+"""
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+
+from flyweight_pattern import MappedUserTable, UserTable, random_string
+
+
+class SharedUserTable(MappedUserTable):  # same layout as the on-disk file, just living in shared memory
+    def __init__(self, name):
+        self._shm = SharedMemory(name=name)
+        try:
+            self._load(self._shm.buf, name)
+        except Exception:
+            self._release()
+            self._shm.close()
+            raise
+
+    @staticmethod
+    def publish(table):
+        data = table.to_bytes()
+        shm = SharedMemory(create=True, size=len(data))
+        shm.buf[:len(data)] = data
+        return shm
+
+    def close(self):
+        self._release()
+        self._shm.close()
+
+
+class UserTableWriter:  # the single writer - owns the mutable table and the published block
+    def __init__(self, table):
+        self.table = table
+        self.pending = multiprocessing.SimpleQueue()
+        self.shm = SharedUserTable.publish(table)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def apply_pending(self):
+        added = 0
+        while not self.pending.empty():
+            self.table.add(self.pending.get())
+            added += 1
+        if added:  # workers still attached to the old block keep reading it until they reattach
+            old, self.shm = self.shm, SharedUserTable.publish(self.table)
+            old.close()
+            old.unlink()
+        return added
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+_attached = {}  # per worker process: block name -> SharedUserTable
+_pending = None
+
+
+def _init_worker(pending):
+    global _pending
+    _pending = pending
+
+
+def _attach(name):
+    if name not in _attached:
+        for table in _attached.values():
+            table.close()
+        _attached.clear()
+        _attached[name] = SharedUserTable(name)
+    return _attached[name]
+
+
+def count_last_name(args):  # read-only
+    name, last_name = args
+    return last_name, len(_attach(name).with_last_name(last_name))
+
+
+def add_name(full_name):  # new names go through the writer, visible once it publishes the next block
+    _pending.put(full_name)
+
+
+if __name__ == "__main__":
+    first_names = [random_string() for x in range(100)]
+    last_names = [random_string() for x in range(100)]
+    writer = UserTableWriter(
+        UserTable.from_full_names(f"{first} {last}" for first in first_names for last in last_names)
+    )
+
+    with multiprocessing.Pool(4, initializer=_init_worker, initargs=(writer.pending,)) as pool:
+        queries = last_names[:3] + ["newcomer"]
+        print(pool.map(count_last_name, [(writer.name, q) for q in queries]))
+        pool.map(add_name, [f"{first} newcomer" for first in first_names[:2]])
+        print(f"{writer.apply_pending()} name(s) added by the writer")
+        print(pool.map(count_last_name, [(writer.name, q) for q in queries]))
+
+    writer.close()
@@ -1,3 +1,10 @@
+import re
+import sys
+from bisect import bisect_right
+from enum import IntFlag
+from random import random
+
+
 class FormattedText:
     def __init__(self, plain_text):
         self.plain_text = plain_text
@@ -7,41 +14,503 @@ class FormattedText:
         for i in range(start, end):
             self.caps[i] = True
 
-    def __str__(self):
+    def _render(self, start, end):
         result = []
-        for idx, val in enumerate(self.plain_text):
+        for idx in range(start, end):
+            val = self.plain_text[idx]
             result.append(val.upper() if self.caps[idx] else val)
         return "".join(result)
 
+    def iter_chunks(self, chunk_size=65536):
+        for start in range(0, len(self.plain_text), chunk_size):
+            yield self._render(start, min(start + chunk_size, len(self.plain_text)))
+
+    def render_to(self, stream, chunk_size=65536):  # memory bounded by chunk_size, not by the text size
+        for chunk in self.iter_chunks(chunk_size):
+            stream.write(chunk)
+
+    def __str__(self):
+        return self._render(0, len(self.plain_text))
+
+
+class FormattingList(list):  # list of ranges that tells its owner about every change
+    def __init__(self, owner, ranges=()):
+        super().__init__(ranges)
+        self.owner = owner
+        owner._adopt(self)
+
+    def _adopt(self, ranges):
+        self.owner._adopt(ranges)
+
+    def _release(self, ranges):  # only ranges that are really gone - the same range may be listed twice
+        remaining = set(map(id, self))
+        self.owner._release([r for r in ranges if id(r) not in remaining])
+
+    def append(self, r):
+        super().append(r)
+        self._adopt([r])
+
+    def insert(self, index, r):
+        super().insert(index, r)
+        self._adopt([r])
+
+    def extend(self, ranges):
+        ranges = list(ranges)
+        super().extend(ranges)
+        self._adopt(ranges)
+
+    def __iadd__(self, ranges):
+        self.extend(ranges)
+        return self
+
+    def __imul__(self, n):
+        ranges = list(self)
+        super().__imul__(n)
+        self._release(ranges)  # n < 1 empties the list, otherwise this only drops the merged ranges
+        return self
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            old, value = self[index], list(value)  # value may be a one-shot iterator
+        else:
+            old = [self[index]]
+        super().__setitem__(index, value)
+        self._adopt(value if isinstance(index, slice) else [value])
+        self._release(old)
+
+    def __delitem__(self, index):
+        old = self[index] if isinstance(index, slice) else [self[index]]
+        super().__delitem__(index)
+        self._release(old)
+
+    def remove(self, r):
+        super().remove(r)
+        self._release([r])
+
+    def pop(self, index=-1):
+        r = super().pop(index)
+        self._release([r])
+        return r
+
+    def clear(self):
+        old = list(self)
+        super().clear()
+        self._release(old)
+
 
 class BetterFormattedText:
     def __init__(self, plain_text):
         self.plain_text = plain_text
+        self._starts = None  # merged capitalized ranges, rebuilt lazily after any change
+        self._ends = None
         self.formatting = []
 
-    class TextRange:
-        def __init__(self, start, end, capitalize=False):
-            self.start = start
-            self.end = end
-            self.capitalize = capitalize
+    class TextRange:  # any change to a range drops the owner's merged ranges
+        _marks = None  # (start, end) nodes of the piece tree while owned by an EditableFormattedText
+
+        def __init__(self, start, end, capitalize=False, owner=None):
+            self.owner = owner
+            self._start = start
+            self._end = end
+            self._capitalize = capitalize
+
+        @property
+        def start(self):
+            return self._start if self._marks is None else self._marks[0].offset()
+
+        @start.setter
+        def start(self, value):
+            self._start, self._end = value, self.end
+            if self.owner:
+                self.owner._range_changed(self)
+
+        @property
+        def end(self):
+            return self._end if self._marks is None else self._marks[1].offset() - 1
+
+        @end.setter
+        def end(self, value):
+            self._start, self._end = self.start, value
+            if self.owner:
+                self.owner._range_changed(self)
+
+        @property
+        def capitalize(self):
+            return self._capitalize
+
+        @capitalize.setter
+        def capitalize(self, value):
+            self._capitalize = value
+            if self.owner:
+                self.owner._invalidate()
 
         def covers(self, position):
             return self.start <= position <= self.end
 
+    @property
+    def formatting(self):
+        return self._formatting
+
+    @formatting.setter
+    def formatting(self, ranges):
+        old = getattr(self, "_formatting", [])
+        self._formatting = FormattingList(self, ranges)
+        self._formatting._release(old)
+
+    def _adopt(self, ranges):
+        for r in ranges:
+            r.owner = self
+        self._invalidate()
+
+    def _release(self, ranges):  # detached ranges no longer report changes here
+        for r in ranges:
+            r.owner = None
+        self._invalidate()
+
     def get_range(self, start, end):
         range = self.TextRange(start, end)
         self.formatting.append(range)
         return range
 
-    def __str__(self):
+    def _range_changed(self, r):
+        self._invalidate()
+
+    def _invalidate(self):
+        self._starts = self._ends = None
+
+    def _merged(self):  # sorting once and merging overlapping/adjacent ranges - O(k log k)
+        if self._starts is None:
+            self._starts, self._ends = [], []
+            for r in sorted((r for r in self.formatting if r.capitalize and r.start <= r.end),
+                            key=lambda r: r.start):
+                if self._ends and r.start <= self._ends[-1] + 1:
+                    self._ends[-1] = max(self._ends[-1], r.end)
+                else:
+                    self._starts.append(r.start)
+                    self._ends.append(r.end)
+        return self._starts, self._ends
+
+    def formatting_at(self, position):  # binary search over merged ranges - O(log k)
+        starts, ends = self._merged()
+        i = bisect_right(starts, position) - 1
+        if i >= 0 and position <= ends[i]:
+            return self.TextRange(starts[i], ends[i], capitalize=True)
+        return None
+
+    def __len__(self):
+        return len(self.plain_text)
+
+    def _slice(self, start, end):
+        return self.plain_text[start:end]
+
+    def iter_chunks(self, chunk_size=65536):  # ranges crossing a chunk boundary are split between chunks
+        starts, ends = self._merged()
+        length = len(self)
+        i = 0
+        for chunk_start in range(0, length, chunk_size):
+            chunk_end = min(chunk_start + chunk_size, length)
+            text = self._slice(chunk_start, chunk_end)
+            while i < len(starts) and ends[i] < chunk_start:
+                i += 1
+            result = []
+            pos = chunk_start
+            j = i
+            while j < len(starts) and starts[j] < chunk_end:
+                start, end = max(starts[j], pos), min(ends[j] + 1, chunk_end)
+                if start < end:
+                    result.append(text[pos - chunk_start:start - chunk_start])
+                    result.append(text[start - chunk_start:end - chunk_start].upper())
+                    pos = end
+                j += 1
+            result.append(text[pos - chunk_start:])
+            yield "".join(result)
+
+    def render_to(self, stream, chunk_size=65536):  # memory bounded by chunk_size, not by the text size
+        for chunk in self.iter_chunks(chunk_size):
+            stream.write(chunk)
+
+    def __str__(self):  # single sweep over the text, one slice per range - O(n + k log k)
+        text = self.plain_text
+        result = []
+        pos = 0
+        for start, end in zip(*self._merged()):
+            start = max(start, pos)
+            if end < start:
+                continue
+            result.append(text[pos:start])
+            result.append(text[start:end + 1].upper())
+            pos = end + 1
+        result.append(text[pos:])
+        return "".join(result)
+
+
+class PieceNode:  # node of the piece tree: a slice of a source string, or a zero-width range mark
+    __slots__ = ("source", "start", "length", "mark", "priority", "left", "right", "parent", "total", "marks")
+
+    def __init__(self, source=None, start=0, length=0, mark=None):
+        self.source = source
+        self.start = start
+        self.length = length
+        self.mark = mark  # (range, is_start) for marks, None for pieces
+        self.priority = random()  # treap heap key - keeps the tree balanced in expectation
+        self.left = self.right = self.parent = None
+        self.total = length  # characters in the subtree
+        self.marks = 1 if mark else 0  # marks in the subtree
+
+    def update(self):  # recomputes the subtree sums after a child changed
+        self.total, self.marks = self.length, 1 if self.mark else 0
+        for child in (self.left, self.right):
+            if child is not None:
+                child.parent = self
+                self.total += child.total
+                self.marks += child.marks
+        return self
+
+    def offset(self):  # characters before this node, summed on the way up to the root - O(log n)
+        offset = self.left.total if self.left else 0
+        node = self
+        while node.parent is not None:
+            parent = node.parent
+            if node is parent.right:
+                offset += (parent.left.total if parent.left else 0) + parent.length
+            node = parent
+        return offset
+
+
+def _merge(left, right):  # all of left followed by all of right
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return left.update()
+    right.left = _merge(left, right.left)
+    return right.update()
+
+
+def _split(node, offset):  # (before offset, from offset on) - end marks at offset stay before, start marks go after
+    if node is None:
+        return None, None
+    position = node.left.total if node.left else 0
+    if offset < position or offset == position and (node.mark is None or node.mark[1]):
+        before, node.left = _split(node.left, offset)
+        return before, node.update()
+    if offset < position + node.length:  # the piece straddles offset - it is cut in two, the text is not copied
+        head = offset - position
+        tail = PieceNode(node.source, node.start + head, node.length - head)
+        node.length, after, node.right = head, node.right, None
+        return node.update(), _merge(tail, after)
+    node.right, after = _split(node.right, offset - position - node.length)
+    return node.update(), after
+
+
+def _walk(node, marks_only=False, start=0, end=float("inf")):  # in-order (node, offset) pairs, pruned subtrees skipped
+    stack, base = [], 0
+    while stack or node is not None:
+        while node is not None and (node.marks if marks_only else base < end and base + node.total > start):
+            stack.append((node, base))
+            node = node.left
+        if not stack:
+            return
+        node, base = stack.pop()
+        offset = base + (node.left.total if node.left else 0)
+        if node.mark or not marks_only:
+            yield node, offset
+        node, base = node.right, offset + node.length
+
+
+class EditableFormattedText(BetterFormattedText):  # text kept as a balanced piece tree - edits never copy the text
+    # The pieces live in a treap where every node knows the length of its subtree, so an offset is found in
+    # O(log n). Range ends are zero-width marks in the same tree: an edit moves every range after it for free.
+    @property
+    def plain_text(self):
+        return "".join(node.source[node.start:node.start + node.length]
+                       for node, _ in _walk(self._root) if node.mark is None)
+
+    @plain_text.setter
+    def plain_text(self, text):
+        ranges = [r for r in getattr(self, "_formatting", []) if r._marks]
+        for r in ranges:
+            r._start, r._end, r._marks = r.start, r.end, None
+        self._root = PieceNode(text, 0, len(text)) if text else None
+        for r in ranges:
+            self._place(r, r._start, r._end)
+        self._invalidate()
+
+    def __len__(self):
+        return self._root.total if self._root else 0
+
+    def _set_root(self, *parts):
+        root = None
+        for part in parts:
+            root = _merge(root, part)
+        if root is not None:
+            root.parent = None
+        self._root = root
+
+    def _slice(self, start, end):  # copying only the pieces overlapping [start, end) - O(log n + pieces)
+        result = []
+        for node, offset in _walk(self._root, start=start, end=end):
+            lo, hi = max(start - offset, 0), min(end - offset, node.length)
+            if lo < hi:
+                result.append(node.source[node.start + lo:node.start + hi])
+        return "".join(result)
+
+    def _place(self, r, start, end):  # marks go to the start and just past the end, clamped to the text
+        r._marks = (PieceNode(mark=(r, True)), PieceNode(mark=(r, False)))
+        for mark, offset in zip(r._marks, (start, end + 1)):
+            before, after = _split(self._root, min(max(offset, 0), len(self)))
+            self._set_root(before, mark, after)
+
+    def _unplace(self, r):
+        for mark in r._marks:
+            parent, child = mark.parent, _merge(mark.left, mark.right)
+            if parent is None:
+                self._set_root(child)
+                continue
+            if parent.left is mark:
+                parent.left = child
+            else:
+                parent.right = child
+            while parent is not None:
+                parent.update()
+                parent = parent.parent
+        r._marks = None
+
+    def _adopt(self, ranges):
+        for r in ranges:
+            if r._marks is None:
+                self._place(r, r._start, r._end)
+        super()._adopt(ranges)
+
+    def _release(self, ranges):  # released ranges keep their current offsets as plain numbers
+        for r in ranges:
+            if r._marks:
+                start, end = r.start, r.end
+                self._unplace(r)
+                r._start, r._end = start, end
+        super()._release(ranges)
+
+    def _range_changed(self, r):
+        if r._marks:
+            self._unplace(r)
+            self._place(r, r._start, r._end)
+        super()._range_changed(r)
+
+    def _merged(self):  # capitalized stretches straight from the marks, already in text order - O(k log n)
+        if self._starts is None:
+            self._starts, self._ends = [], []
+            open_ranges, closed = set(), set()  # closed: end mark met first, i.e. an empty range
+            for node, offset in _walk(self._root, marks_only=True):
+                r, is_start = node.mark
+                if is_start:
+                    if r.capitalize and r not in closed:
+                        if not open_ranges:
+                            if self._ends and offset <= self._ends[-1] + 1:
+                                self._ends.pop()  # adjacent to the previous stretch - extend it
+                            else:
+                                self._starts.append(offset)
+                        open_ranges.add(r)
+                elif r in open_ranges:
+                    open_ranges.remove(r)
+                    if not open_ranges:
+                        self._ends.append(offset - 1)
+                else:
+                    closed.add(r)
+        return self._starts, self._ends
+
+    def insert(self, offset, text):  # O(log n): one split, one new piece, two merges
+        if not text:
+            return
+        if not 0 <= offset <= len(self):
+            raise IndexError("offset out of range")
+        before, after = _split(self._root, offset)
+        self._set_root(before, PieceNode(text, 0, len(text)), after)
+        self._invalidate()
+
+    def delete(self, offset, length):  # O(log n + range ends inside the deleted text)
+        length = min(length, len(self) - offset)
+        if length <= 0:
+            return
+        if offset < 0:
+            raise IndexError("offset out of range")
+        before, rest = _split(self._root, offset)
+        deleted, after = _split(rest, length)
+        starts, ends = [], []  # marks inside the deleted text all move to offset, ends before starts
+        for mark, _ in _walk(deleted, marks_only=True):
+            (starts if mark.mark[1] else ends).append(mark)
+        for mark in ends + starts:
+            mark.left = mark.right = None
+            mark.update()
+        self._set_root(before, *ends, *starts, after)
+        inside = {mark.mark[0] for mark in starts if mark.mark[0].end < offset}
+        if inside:  # ranges that started in the deleted text and are left empty disappear
+            for r in inside:
+                self._unplace(r)
+                r._start, r._end = offset, offset - 1
+            self.formatting[:] = [r for r in self.formatting if r not in inside]
+        self._invalidate()
+
+
+class Format(IntFlag):
+    CAPS = 1
+    BOLD = 2
+    ITALIC = 4
+    UNDERLINE = 8
+
+
+class AttributedText:  # one byte of attribute bits per character instead of one list item per attribute
+    _codes = {Format.BOLD: "1", Format.ITALIC: "3", Format.UNDERLINE: "4"}  # ANSI SGR codes
+    _runs = re.compile(rb"(.)\1*", re.DOTALL)
+    _set_tables = {}  # fmt -> 256-byte translation table, shared by all instances
+    _clear_tables = {}
+
+    def __init__(self, plain_text):
+        self.plain_text = plain_text
+        self.attributes = bytearray(len(plain_text))
+
+    def apply(self, start, end, fmt):  # setting/clearing bits for a whole slice at once (bytes.translate runs in C)
+        table = self._set_tables.get(fmt)
+        if table is None:
+            table = self._set_tables[fmt] = bytes(b | fmt for b in range(256))
+        self.attributes[start:end] = self.attributes[start:end].translate(table)
+
+    def clear(self, start, end, fmt):
+        table = self._clear_tables.get(fmt)
+        if table is None:
+            table = self._clear_tables[fmt] = bytes(b & ~fmt & 0xFF for b in range(256))
+        self.attributes[start:end] = self.attributes[start:end].translate(table)
+
+    def capitalize(self, start, end):
+        self.apply(start, end, Format.CAPS)
+
+    def _render(self, start, end):  # one step per run of identically formatted characters, not per character
         result = []
-        for idx, val in enumerate(self.plain_text):
-            for r in self.formatting:
-                if r.covers(idx) and r.capitalize:
-                    val = val.upper()
-            result.append(val)
+        prefixes = {}
+        for run in self._runs.finditer(self.attributes, start, end):
+            fmt = self.attributes[run.start()]
+            chunk = self.plain_text[run.start():run.end()]
+            if fmt & Format.CAPS:
+                chunk = chunk.upper()
+            if fmt & ~Format.CAPS:
+                if fmt not in prefixes:
+                    prefixes[fmt] = ";".join(code for flag, code in self._codes.items() if fmt & flag)
+                chunk = f"\033[{prefixes[fmt]}m{chunk}\033[0m"
+            result.append(chunk)
         return "".join(result)
 
+    def iter_chunks(self, chunk_size=65536):
+        for start in range(0, len(self.plain_text), chunk_size):
+            yield self._render(start, min(start + chunk_size, len(self.plain_text)))
+
+    def render_to(self, stream, chunk_size=65536):  # memory bounded by chunk_size, not by the text size
+        for chunk in self.iter_chunks(chunk_size):
+            stream.write(chunk)
+
+    def __str__(self):
+        return self._render(0, len(self.plain_text))
+
 
 if __name__ == "__main__":
     text = "This is a brave new world"
@@ -52,3 +521,17 @@ if __name__ == "__main__":
     bft = BetterFormattedText(text)
     bft.get_range(16, 19).capitalize = True
     print(bft)
+    print(bft.formatting_at(17).start, bft.formatting_at(17).end, bft.formatting_at(3))
+
+    eft = EditableFormattedText(text)
+    eft.get_range(16, 19).capitalize = True
+    eft.insert(10, "very ")
+    eft.delete(0, 5)
+    print(eft)
+    eft.render_to(sys.stdout, chunk_size=4)
+    print()
+
+    at = AttributedText(text)
+    at.capitalize(10, 15)
+    at.apply(8, 19, Format.BOLD | Format.UNDERLINE)
+    print(at)